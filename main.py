@@ -5,6 +5,20 @@ from sam2_tools.auto_segmentation import run_auto_segmentation
 from sam2_tools.box_segmentation import run_box_segmentation
 from sam2_tools.point_segmentation import run_point_segmentation
 from sam2_tools.shared_utils import load_or_create_config, get_config_path
+from sam2_tools.memory_governor import parse_memory
+
+
+def model_arg(value):
+    return "auto" if value == "auto" else int(value)
+
+
+def memory_arg(value):
+    # Validate here so a typo is a usage error; plan_job parses it again
+    try:
+        parse_memory(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
+    return value
 
 
 def parse_args():
@@ -13,14 +27,24 @@ def parse_args():
     parser.add_argument("-i", "--input", required=False, help="Input image path")
     parser.add_argument("-o", "--output", required=False, help="Output folder")
     parser.add_argument("-n", "--num-masks", type=int, default=3, help="Number of masks to save (box and auto mode only)")
-    parser.add_argument("-m", "--model", type=int, default=1, help="Model ID from 1 to 4 (Default: sam2.1_hiera_large) ")
+    parser.add_argument("-m", "--model", type=model_arg, default=1, help="Model ID from 1 to 4, or auto to start with the smallest model and escalate on low scores (box and point modes) (Default: sam2.1_hiera_large) ")
+    parser.add_argument("--cascade-threshold", type=float, help="Score below which --model auto re-runs on the next larger model (Default: cascade_threshold in config, else 0.85)")
     parser.add_argument("-s", "--box", nargs=4, type=int, help="Generate masks from a box selection. Optional box coordinate: x1 y1 x2 y2")
     parser.add_argument("--pfm", action="store_true", help="Save mask as .pfm instead of .png")
+    parser.add_argument("--tiled", action="store_true", help="Upsample masks tile by tile straight into the output file (box and point modes, lower memory)")
     parser.add_argument("--overlay", action="store_true", help="Save overlay image (box mode only)")
     parser.add_argument("--points", action="store_true", help="Generate masks from point-based selection")
+    parser.add_argument("--point", nargs=3, type=int, action="append", metavar=("X", "Y", "LABEL"), help="Point prompt for point mode, repeatable. LABEL 1 = foreground, 0 = background. Skips the point selection window")
     parser.add_argument("--auto", action="store_true", help="Generate automatic masks")
+    parser.add_argument("--stream", action="store_true", help="Keep auto masks compressed and decode only the saved ones (auto mode only, lower memory)")
+    parser.add_argument("--rank", choices=["iou", "stability", "area"], help="Rank auto masks by predicted IoU, stability or area and skip near-duplicates (auto mode only)")
+    parser.add_argument("--max-overlap", type=float, default=0.8, help="Max IoU between two saved masks when --rank is used (Default: 0.8)")
+    parser.add_argument("--max-memory", type=memory_arg, help="Peak memory budget, e.g. 8G or 512M. Picks tiled/streamed output, a lower decode resolution, a smaller points_per_batch or a smaller model to fit (Default: max_memory in config)")
     parser.add_argument("--config", action="store_true", help="Create config file if missing and show the path")
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.model == "auto" and args.auto and not args.points:
+        parser.error("--model auto is only supported in box and point modes")
+    return args
 
 
 def main():
@@ -44,6 +68,10 @@ def main():
             num_masks=args.num_masks,
             model_id=args.model,
             pfm=args.pfm,
+            tiled=args.tiled,
+            points=args.point,
+            max_memory=args.max_memory,
+            cascade_threshold=args.cascade_threshold,
         )
 
     elif args.auto:
@@ -53,6 +81,10 @@ def main():
             num_masks=args.num_masks,
             model_id=args.model,
             pfm=args.pfm,
+            stream=args.stream,
+            rank=args.rank,
+            max_overlap=args.max_overlap,
+            max_memory=args.max_memory,
         )
 
     else:
@@ -64,6 +96,9 @@ def main():
             box=args.box,
             pfm=args.pfm,
             overlay=args.overlay,
+            tiled=args.tiled,
+            max_memory=args.max_memory,
+            cascade_threshold=args.cascade_threshold,
         )
 
 
@@ -1,19 +1,22 @@
 import os
-import numpy as np
-import torch
-from PIL import Image
-from datetime import datetime, timezone
-from sam2.build_sam import build_sam2
-from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
-from .shared_utils import (
-    load_or_create_config,
-    get_unique_path,
-    save_pfm,
-    load_image_rgb,
-)
 
-
-def run_auto_segmentation(input_path, output_path, num_masks, model_id, pfm):
+from .shared_utils import load_image_rgb
+from .mask_utils import select_masks
+from .segmenter import Segmenter
+from .memory_governor import plan_job, output_size
+
+
+def run_auto_segmentation(
+    input_path,
+    output_path,
+    num_masks,
+    model_id,
+    pfm,
+    stream=False,
+    rank=None,
+    max_overlap=0.8,
+    max_memory=None,
+):
     # To save in a subfolder
     # base = os.path.splitext(os.path.basename(input_path))[0]
     # save_dir = os.path.join(output_path, base)
@@ -22,48 +25,36 @@ def run_auto_segmentation(input_path, output_path, num_masks, model_id, pfm):
     save_dir = output_path
     base = os.path.splitext(os.path.basename(input_path))[0]
 
-    # Load config
-    config = load_or_create_config()
-    checkpoints = config["checkpoints"]
-    checkpoint = checkpoints[str(model_id)]
-
-    # Select model config
-    if model_id == 1:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_l.yaml"
-    elif model_id == 2:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_b+.yaml"
-    elif model_id == 3:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_s.yaml"
-    else:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_t.yaml"
+    if model_id == "auto":
+        raise ValueError("Model 'auto' is only supported in box and point modes.")
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print("Using device:", device)
+    # Fit model, decode size and batch size to the memory budget
+    plan = plan_job(input_path, "auto", model_id, max_memory, stream=stream)
+    model_id, stream = plan["model_id"], plan["stream"]
 
     # Load model
-    sam2_model = build_sam2(
-        model_cfg, checkpoint, device=device, apply_postprocessing=False
-    )
-    generator = SAM2AutomaticMaskGenerator(sam2_model)
+    segmenter = Segmenter(model_id, apply_postprocessing=False)
+    print("Using device:", segmenter.device)
 
     # Load input
-    image_np, _ = load_image_rgb(input_path)
+    image_np, _ = load_image_rgb(input_path, plan["scale"])
     if image_np is None:
         return
+    output_hw, _ = output_size(input_path, image_np, plan["scale"])
+    segmenter.set_image(image_np, name=base, output_hw=output_hw)
 
-    with torch.inference_mode():
-        masks = generator.generate(image_np)
+    # Streaming mode keeps masks as uncompressed RLE instead of full-res
+    # boolean arrays; only the saved masks are decoded, one at a time.
+    masks = segmenter.generate(
+        stream=stream, points_per_batch=plan["points_per_batch"]
+    )
 
     print("Generated masks:", len(masks))
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
-    # Save masks
-    for i, m in enumerate(masks[:num_masks]):
-        seg = m["segmentation"]
-        if pfm:
-            out = get_unique_path(f"{save_dir}/{base}_{ts}_mask_{i}.pfm")
-            save_pfm(out, seg)
-        else:
-            out = get_unique_path(f"{save_dir}/{base}_{ts}_mask_{i}.png")
-            Image.fromarray(seg.astype(np.uint8) * 255).save(out)
+    # Drop the candidates we won't save before decoding anything
+    if rank:
+        masks = select_masks(masks, num_masks, rank, max_overlap)
+        print(f"Selected masks (rank={rank}, max overlap={max_overlap}):", len(masks))
+    else:
+        masks = masks[:num_masks]
 
-        print("Saved:", out)
+    segmenter.save_masks(masks, segmenter.output_stem(save_dir), pfm)
@@ -1,24 +1,22 @@
 import os
-import numpy as np
-import torch
 import cv2
-from PIL import Image
-from datetime import datetime, timezone
 
-from sam2.build_sam import build_sam2
-from sam2.sam2_image_predictor import SAM2ImagePredictor
-
-from .shared_utils import (
-    load_or_create_config,
-    get_unique_path,
-    save_pfm,
-    load_image_rgb,
-    BoxSelector,
-)
+from .shared_utils import load_image_rgb, BoxSelector
+from .cascade import CascadeSegmenter, make_segmenter
+from .memory_governor import plan_job, output_size, scale_coords
 
 
 def run_box_segmentation(
-    input_path, output_path, num_masks, model_id, box, pfm, overlay
+    input_path,
+    output_path,
+    num_masks,
+    model_id,
+    box,
+    pfm,
+    overlay,
+    tiled=False,
+    max_memory=None,
+    cascade_threshold=None,
 ):
     # To save in a subfolder
     # base = os.path.splitext(os.path.basename(input_path))[0]
@@ -28,27 +26,16 @@ def run_box_segmentation(
     save_dir = output_path
     base = os.path.splitext(os.path.basename(input_path))[0]
 
-    config = load_or_create_config()
-    checkpoints = config["checkpoints"]
-    checkpoint = checkpoints[str(model_id)]
-
-    # Model config
-    if model_id == 1:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_l.yaml"
-    elif model_id == 2:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_b+.yaml"
-    elif model_id == 3:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_s.yaml"
-    else:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_t.yaml"
-
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print("Using device:", device)
+    # Fit model, decode size and output path to the memory budget
+    plan = plan_job(input_path, "box", model_id, max_memory, tiled=tiled)
+    model_id, tiled = plan["model_id"], plan["tiled"]
 
-    rgb, bgr_img = load_image_rgb(input_path)
+    rgb, bgr_img = load_image_rgb(input_path, plan["scale"])
     if rgb is None or bgr_img is None:
         return
-    H, W, _ = bgr_img.shape
+    output_hw, coords_scale = output_size(input_path, rgb, plan["scale"])
+    if box is not None:
+        box = scale_coords(box, coords_scale)
 
     # Get user box if not provided
     if box is None:
@@ -74,42 +61,26 @@ def run_box_segmentation(
                 return
         cv2.destroyAllWindows()
 
-    x1, y1, x2, y2 = box
-
     # Load model
-    sam2_model = build_sam2(model_cfg, checkpoint, device=device)
-    predictor = SAM2ImagePredictor(sam2_model)
-
-    # Predict masks
-    box_arr = np.array([x1, y1, x2, y2], dtype=np.float32)
+    # model_id "auto" = cascade from the smallest model
+    segmenter = make_segmenter(model_id, cascade_threshold, plan["cascade_models"])
+    print("Using device:", segmenter.device)
+    segmenter.set_image(rgb, name=base, output_hw=output_hw)
 
-    with torch.inference_mode():
-        predictor.set_image(rgb)
-        masks, scores, _ = predictor.predict(box=box_arr, multimask_output=True)
+    # Predict masks (tiled keeps the 256x256 logits; they are upsampled tile
+    # by tile while saving)
+    masks, scores = segmenter.predict_box(box, low_res=tiled)
 
     if len(masks) == 0:
         print("No masks returned.")
         return
 
-    order = np.argsort(-np.array(scores))
-    masks = np.array(masks)[order]
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
     # Save masks
-    for i, m in enumerate(masks[:num_masks]):
-        seg = np.squeeze(m)
-        if pfm:
-            out = get_unique_path(f"{save_dir}/{base}_{ts}_mask_{i}.pfm")
-            save_pfm(out, seg.astype(np.float32))
-        else:
-            out = get_unique_path(f"{save_dir}/{base}_{ts}_mask_{i}.png")
-            mask = seg.astype(np.uint8)
-            Image.fromarray(mask * 255).save(out)
+    stem = segmenter.output_stem(save_dir)
+    paths = segmenter.save_masks(masks[:num_masks], stem, pfm, logits=tiled)
+    if isinstance(segmenter, CascadeSegmenter):
+        segmenter.record("box", paths)
 
     # Optional overlay
     if overlay:
-        best = np.squeeze(masks[0]).astype(bool)
-        overlay_img = rgb.copy()
-        overlay_img[best] = [255, 0, 0]
-        out = get_unique_path(f"{save_dir}/{base}_{ts}_overlay.jpg")
-        Image.fromarray(overlay_img).save(out, quality=95)
-        print("Saved overlay:", out)
+        segmenter.save_overlay(masks[0], stem, logits=tiled)
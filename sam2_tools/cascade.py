@@ -0,0 +1,154 @@
+import os
+import json
+from datetime import datetime, timezone
+
+from .shared_utils import load_or_create_config, get_config_path, load_image_rgb
+from .segmenter import Segmenter, get_device
+from .memory_governor import MODEL_NAMES, cascade_models
+
+# Escalate to the next model when the best predicted IoU is below this
+DEFAULT_THRESHOLD = 0.85
+
+
+def get_cascade_log_path():
+    return get_config_path().parent / "cascade_log.jsonl"
+
+
+def make_segmenter(model_id, cascade_threshold=None, model_ids=None, **kwargs):
+    """``Segmenter`` for a model ID, or a ``CascadeSegmenter`` for "auto".
+
+    ``model_ids`` limits the cascade (e.g. ``plan_job``'s ``cascade_models``).
+    """
+    if model_id == "auto":
+        return CascadeSegmenter(
+            threshold=cascade_threshold, model_ids=model_ids, **kwargs
+        )
+    return Segmenter(model_id, **kwargs)
+
+
+# ============================================================
+# Cascade Segmenter (smallest model first, escalate on low score)
+# ============================================================
+class CascadeSegmenter:
+    """Box/point ``Segmenter`` that starts with the smallest model.
+
+    Each query runs on the smallest model first and re-runs on the next
+    larger one only while the best predicted IoU score is below
+    ``threshold``. Models are loaded on first use and kept for later queries.
+    ``last`` is the ``Segmenter`` that produced the most recent masks and
+    ``attempts`` lists the score of every model tried for them.
+    """
+
+    def __init__(self, threshold=None, model_ids=None, device=None, config=None):
+        self.config = config or load_or_create_config()
+        if threshold is None:
+            threshold = self.config.get("cascade_threshold", DEFAULT_THRESHOLD)
+        self.threshold = float(threshold)
+        self.model_ids = model_ids or cascade_models(self.config)
+        if not self.model_ids:
+            raise ValueError("No downloaded checkpoints found for --model auto.")
+
+        self.device = device or get_device()
+        self._segmenters = {}
+        self._ready = set()  # models that have the current image set
+        self._image = None
+        self.last = None
+        self.attempts = []
+
+    # ------------------------------------------------------------------
+    def set_image(self, image, name=None, output_hw=None):
+        """Same as ``Segmenter.set_image``; each model embeds it on first use."""
+        if isinstance(image, (str, os.PathLike)):
+            path = os.fspath(image)
+            image, _ = load_image_rgb(path)
+            if image is None:
+                raise ValueError(f"Could not load image: {path}")
+            name = name or os.path.splitext(os.path.basename(path))[0]
+
+        self._image = (image, name, output_hw)
+        self._ready.clear()
+        self.last = None
+        self.attempts = []
+
+    def _segmenter(self, model_id):
+        seg = self._segmenters.get(model_id)
+        if seg is None:
+            seg = Segmenter(model_id, self.device, config=self.config)
+            self._segmenters[model_id] = seg
+        if model_id not in self._ready:
+            seg.set_image(*self._image)
+            self._ready.add(model_id)
+        return seg
+
+    def _cascade(self, method, *args, **kwargs):
+        if self._image is None:
+            raise RuntimeError("No image set. Call set_image() first.")
+
+        self.attempts = []
+        for i, model_id in enumerate(self.model_ids):
+            seg = self._segmenter(model_id)
+            masks, scores = getattr(seg, method)(*args, **kwargs)
+            best = float(scores[0]) if len(scores) else 0.0
+            self.attempts.append({"model_id": model_id, "score": best})
+            self.last = seg
+
+            if best >= self.threshold or i + 1 == len(self.model_ids):
+                break
+            print(
+                f"Cascade: {MODEL_NAMES[model_id]} score {best:.3f} < "
+                f"{self.threshold:g}, trying {MODEL_NAMES[self.model_ids[i + 1]]}"
+            )
+        return masks, scores
+
+    def predict_box(self, box, multimask_output=True, low_res=False):
+        return self._cascade(
+            "predict_box", box, multimask_output=multimask_output, low_res=low_res
+        )
+
+    def predict_points(self, points, labels=None, multimask_output=False, low_res=False):
+        return self._cascade(
+            "predict_points",
+            points,
+            labels,
+            multimask_output=multimask_output,
+            low_res=low_res,
+        )
+
+    @property
+    def model_id(self):
+        return self.last.model_id if self.last else None
+
+    @property
+    def mask_threshold(self):
+        return self.last.mask_threshold
+
+    # ------------------------------------------------------------------
+    # Saving goes through the model that produced the masks
+    def output_stem(self, output_path):
+        return self.last.output_stem(output_path)
+
+    def save_masks(self, masks, stem, pfm=False, indexed=True, logits=False):
+        return self.last.save_masks(masks, stem, pfm, indexed, logits)
+
+    def save_overlay(self, mask, stem, logits=False):
+        return self.last.save_overlay(mask, stem, logits)
+
+    def record(self, mode, paths):
+        """Print and append the last query to the cascade log (JSON lines)."""
+        chosen = self.attempts[-1]
+        print(
+            f"Cascade: mask from {MODEL_NAMES[chosen['model_id']]} "
+            f"(score {chosen['score']:.3f}, threshold {self.threshold:g})"
+        )
+
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "image": self.last.name,
+            "mode": mode,
+            "threshold": self.threshold,
+            "model_id": chosen["model_id"],
+            "attempts": self.attempts,
+            "outputs": [str(p) for p in paths],
+        }
+        with open(get_cascade_log_path(), "a") as f:
+            f.write(json.dumps(entry) + "\n")
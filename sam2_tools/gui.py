@@ -34,12 +34,13 @@ def start_gui():
     ).grid(row=1, column=2)
 
     tk.Label(root, text="Model:").grid(row=2, column=0)
-    model_labels = ["Large", "Base+", "Small", "Tiny"]
+    model_labels = ["Large", "Base+", "Small", "Tiny", "Auto"]
     model_id_map = {
         "Large": 1,
         "Base+": 2,
         "Small": 3,
         "Tiny": 4,
+        "Auto": "auto",
     }
     model_var = tk.StringVar(value="Large")
     ttk.Combobox(root, textvariable=model_var, values=model_labels).grid(
@@ -0,0 +1,204 @@
+import numpy as np
+import torch
+from sam2.utils.amg import rle_to_mask
+
+from .shared_utils import save_png_tiles, save_pfm_tiles
+
+# Record key used for each --rank choice
+RANK_KEYS = {
+    "iou": "predicted_iou",
+    "stability": "stability_score",
+    "area": "area",
+}
+
+# Output rows upsampled at once in tiled mode
+TILE_ROWS = 256
+
+# Number of set bits for every byte value (fallback for numpy < 2.0)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+# ============================================================
+# Packed-bit masks
+# ============================================================
+def record_mask(record):
+    """Return the full-resolution boolean mask of a generator record."""
+    seg = record["segmentation"]
+    if isinstance(seg, dict):
+        return rle_to_mask(seg)
+    return np.asarray(seg, dtype=bool)
+
+
+def pack_mask(mask):
+    """Pack a boolean mask into a flat uint8 bitset (8 pixels per byte)."""
+    return np.packbits(np.ascontiguousarray(mask, dtype=bool).ravel())
+
+
+def popcount_rows(packed):
+    """Count the set bits of each row of a (k, nbytes) packed array."""
+    packed = np.atleast_2d(packed)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(packed).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT[packed].sum(axis=1, dtype=np.int64)
+
+
+def packed_iou(packed, areas, others, other_areas):
+    """IoU of one packed mask against each row of a (k, nbytes) packed array."""
+    inter = popcount_rows(np.bitwise_and(others, packed))
+    union = other_areas + areas - inter
+    return np.where(union > 0, inter / np.maximum(union, 1), 0.0)
+
+
+# ============================================================
+# Ranking and deduplication
+# ============================================================
+def _boxes_overlap(a, b):
+    # XYWH boxes from the automatic mask generator; w = x2 - x1 with x2
+    # inclusive, so boxes sharing an edge row/column still touch
+    return (
+        a[0] <= b[0] + b[2]
+        and b[0] <= a[0] + a[2]
+        and a[1] <= b[1] + b[3]
+        and b[1] <= a[1] + a[3]
+    )
+
+
+def select_masks(records, num_masks, rank="iou", max_overlap=0.8):
+    """Pick the top ``num_masks`` records by ``rank``, skipping near-duplicates.
+
+    Candidates are visited best-first and rejected when their IoU with an
+    already selected mask exceeds ``max_overlap``. Masks are only decoded and
+    packed when a cheap bbox/area test says the IoU could exceed the limit.
+    """
+    key = RANK_KEYS[rank]
+    scores = np.array([r[key] for r in records], dtype=np.float64)
+    order = np.argsort(-scores, kind="stable")
+
+    selected = []
+    packed = []  # packed bitsets of selected masks, filled lazily
+    for idx in order:
+        if len(selected) >= num_masks:
+            break
+        cand = records[idx]
+        area = cand["area"]
+
+        # IoU <= min(area) / max(area), and 0 when the boxes don't touch
+        check = [
+            j
+            for j, s in enumerate(selected)
+            if _boxes_overlap(cand["bbox"], s["bbox"])
+            and min(area, s["area"]) > max_overlap * max(area, s["area"])
+        ]
+        if check:
+            for j in check:
+                if packed[j] is None:
+                    packed[j] = pack_mask(record_mask(selected[j]))
+            cand_packed = pack_mask(record_mask(cand))
+            others = np.stack([packed[j] for j in check])
+            other_areas = np.array([selected[j]["area"] for j in check])
+            ious = packed_iou(cand_packed, area, others, other_areas)
+            if ious.max() > max_overlap:
+                continue
+            selected.append(cand)
+            packed.append(cand_packed)
+        else:
+            selected.append(cand)
+            packed.append(None)
+
+    return selected
+
+
+# ============================================================
+# Low-res logits and tiled upsampling
+# ============================================================
+def predict_low_res(
+    predictor, point_coords=None, point_labels=None, box=None, multimask_output=True
+):
+    """Like ``predictor.predict`` but stop at the 256x256 logits.
+
+    Returns ``(logits, scores)`` as NumPy arrays of shape (C, 256, 256) and
+    (C,). Nothing is upsampled to image resolution.
+    """
+    mask_input, coords, labels, box_t = predictor._prep_prompts(
+        point_coords, point_labels, box, None, True
+    )
+
+    points = (coords, labels) if coords is not None else None
+    if box_t is not None:
+        # Boxes are fed to the prompt encoder as two labelled corner points
+        box_coords = box_t.reshape(-1, 2, 2)
+        box_labels = torch.tensor([[2, 3]], dtype=torch.int, device=box_t.device)
+        box_labels = box_labels.repeat(box_t.size(0), 1)
+        if points is not None:
+            points = (
+                torch.cat([box_coords, points[0]], dim=1),
+                torch.cat([box_labels, points[1]], dim=1),
+            )
+        else:
+            points = (box_coords, box_labels)
+
+    model = predictor.model
+    sparse, dense = model.sam_prompt_encoder(points=points, boxes=None, masks=mask_input)
+    high_res = [level[-1].unsqueeze(0) for level in predictor._features["high_res_feats"]]
+    logits, scores, _, _ = model.sam_mask_decoder(
+        image_embeddings=predictor._features["image_embed"][-1].unsqueeze(0),
+        image_pe=model.sam_prompt_encoder.get_dense_pe(),
+        sparse_prompt_embeddings=sparse,
+        dense_prompt_embeddings=dense,
+        multimask_output=multimask_output,
+        repeat_image=False,
+        high_res_features=high_res,
+    )
+    return logits[0].float().cpu().numpy(), scores[0].float().cpu().numpy()
+
+
+def _bilinear_taps(out_size, in_size, start, stop):
+    # Same sampling as F.interpolate(mode="bilinear", align_corners=False)
+    src = (np.arange(start, stop, dtype=np.float64) + 0.5) * (in_size / out_size) - 0.5
+    src = np.maximum(src, 0.0)
+    i0 = np.minimum(src.astype(np.int64), in_size - 1)
+    i1 = np.minimum(i0 + 1, in_size - 1)
+    return i0, i1, (src - i0).astype(np.float32)
+
+
+def iter_mask_tiles(
+    logits, out_hw, threshold=0.0, tile_rows=TILE_ROWS, bottom_up=False
+):
+    """Upsample one low-res logit map to ``out_hw`` and threshold it by tiles.
+
+    Yields ``(y0, tile)`` where ``tile`` is a boolean array covering output
+    rows ``y0:y0 + len(tile)``.
+    """
+    logits = np.asarray(logits, dtype=np.float32)
+    in_h, in_w = logits.shape
+    out_h, out_w = out_hw
+    c0, c1, cw = _bilinear_taps(out_w, in_w, 0, out_w)
+
+    starts = range(0, out_h, tile_rows)
+    if bottom_up:
+        starts = reversed(starts)
+
+    for y0 in starts:
+        y1 = min(y0 + tile_rows, out_h)
+        r0, r1, rw = _bilinear_taps(out_h, in_h, y0, y1)
+        rows = logits[r0] + (logits[r1] - logits[r0]) * rw[:, None]
+        left = rows[:, c0]
+        tile = left + (rows[:, c1] - left) * cw
+        yield y0, tile > threshold
+
+
+def save_logits_mask(path, logits, out_hw, pfm, threshold=0.0):
+    """Upsample, threshold and write one mask without a full-res intermediate."""
+    out_h, out_w = out_hw
+    if pfm:
+        tiles = (
+            t.astype(np.float32)
+            for _, t in iter_mask_tiles(logits, out_hw, threshold, bottom_up=True)
+        )
+        save_pfm_tiles(path, out_w, out_h, tiles)
+    else:
+        tiles = (
+            t.astype(np.uint8) * 255
+            for _, t in iter_mask_tiles(logits, out_hw, threshold)
+        )
+        save_png_tiles(path, out_w, out_h, tiles)
@@ -0,0 +1,245 @@
+import os
+import re
+from pathlib import Path
+
+from .shared_utils import RAW_EXTENSIONS, get_image_size, load_or_create_config
+
+GB = 1024**3
+
+# Rough peak for weights + image encoder activations (fp32, 1024x1024 input)
+MODEL_BYTES = {1: 3.0 * GB, 2: 1.6 * GB, 3: 1.1 * GB, 4: 1.0 * GB}
+MODEL_NAMES = {1: "Large", 2: "Base+", 3: "Small", 4: "Tiny"}
+
+# Python, torch and SAM2 runtime before any model or image is loaded
+BASE_BYTES = 0.5 * GB
+
+# Candidates the auto generator returns (kept full-res unless streaming)
+AUTO_CANDIDATES = 100
+
+# Fallback steps, tried in order
+SCALES = [0.75, 0.5, 0.35, 0.25]
+MIN_POINTS_PER_BATCH = 8
+
+_UNITS = {"B": 1, "K": 1024, "M": 1024**2, "G": GB, "T": 1024**4}
+
+
+def parse_memory(value):
+    """Parse "8G", "512M", "1.5GiB", "4096B" or a bare number of GB into bytes."""
+    if value is None or isinstance(value, (int, float)):
+        return None if value is None else int(value * GB)
+
+    match = re.fullmatch(
+        r"\s*(\d+(?:\.\d*)?|\.\d+)\s*(?:([KMGT])(?:i?B)?|(B))?\s*", str(value), re.I
+    )
+    if not match:
+        raise ValueError(f"Invalid memory size: {value!r} (e.g. 8G, 512M)")
+    unit = (match.group(2) or match.group(3) or "G").upper()
+    return int(float(match.group(1)) * _UNITS[unit])
+
+
+def format_bytes(n):
+    return f"{n / GB:.1f} GB"
+
+
+# ============================================================
+# Footprint estimate
+# ============================================================
+def estimate_peak(
+    height,
+    width,
+    mode,
+    model_id,
+    scale=1.0,
+    tiled=False,
+    stream=False,
+    points_per_batch=64,
+    raw=False,
+    cascade_models=None,
+):
+    """Rough peak memory in bytes for one run of ``mode`` on an image.
+
+    ``model_id`` "auto" (cascade) assumes every model of ``cascade_models``
+    ends up loaded.
+    """
+    model_bytes = _model_bytes(model_id, cascade_models)
+    pixels = height * width
+    work = pixels * scale * scale
+
+    # Decode (RAW keeps a 16-bit 4-channel buffer, halved per side in
+    # half-size mode), then the RGB + BGR copies at working resolution
+    decode_pixels = pixels / 4 if raw and scale <= 0.5 else pixels
+    load = decode_pixels * (3 + (8 if raw else 0)) + work * 3
+    image = work * 6
+
+    if mode == "auto":
+        # Every batch upsamples points_per_batch x 3 float logits to full
+        # size, plus thresholded and stability copies
+        masks = points_per_batch * 3 * work * 6
+        masks += work * (1 if stream else AUTO_CANDIDATES)
+    elif tiled:
+        masks = work * 3
+    else:
+        # 3 float masks, their bool version and the sorted copy
+        masks = work * 18
+
+    if mode == "points":
+        # Selector clone + preview copies (tiled previews paint the logits
+        # tile by tile, so no full-res mask is added there)
+        masks += work * 6
+
+    # Masks are resized back to the original size one at a time when saving
+    if scale < 1.0:
+        masks += pixels
+
+    return BASE_BYTES + model_bytes + max(load, image + masks)
+
+
+def _model_bytes(model_id, cascade_models=None):
+    if model_id == "auto":
+        return sum(MODEL_BYTES[m] for m in cascade_models or MODEL_BYTES)
+    return MODEL_BYTES[model_id]
+
+
+# ============================================================
+# Planning
+# ============================================================
+def _downloaded(model_ids, config):
+    checkpoints = config.get("checkpoints", {})
+    return [m for m in model_ids if os.path.isfile(str(checkpoints.get(str(m), "")))]
+
+
+def cascade_models(config):
+    """Model IDs for the cascade, smallest first.
+
+    Uses the ``cascade_models`` config key if set, otherwise every model
+    whose checkpoint has been downloaded.
+    """
+    if config.get("cascade_models"):
+        return [int(m) for m in config["cascade_models"]]
+    return _downloaded((4, 3, 2, 1), config)
+
+
+def _fallbacks(model_id, config):
+    # Settings to try in order, each a dict of plan keys. A single model
+    # falls back to smaller downloaded ones (larger ID = smaller model); the
+    # cascade ("auto") drops its largest models instead.
+    if model_id == "auto":
+        models = cascade_models(config)
+        return [{"cascade_models": models[:n]} for n in range(len(models), 0, -1)]
+    return [{"model_id": model_id}] + [
+        {"model_id": m} for m in _downloaded(range(model_id + 1, 5), config)
+    ]
+
+
+def plan_job(
+    input_path,
+    mode,
+    model_id,
+    max_memory=None,
+    tiled=False,
+    stream=False,
+    points_per_batch=64,
+):
+    """Pick model, decode scale and batch size so a job fits ``max_memory``.
+
+    ``max_memory`` falls back to the ``max_memory`` config key. Without a
+    budget the requested settings are returned unchanged. Each change is
+    printed. With ``plan["scale"] < 1`` prompts given in original image
+    coordinates must be rescaled (see ``output_size`` and ``scale_coords``).
+    """
+    plan = {
+        "model_id": model_id,
+        "scale": 1.0,
+        "tiled": tiled,
+        "stream": stream,
+        "points_per_batch": points_per_batch,
+        "cascade_models": None,
+    }
+
+    config = load_or_create_config()
+    if model_id == "auto":
+        plan["cascade_models"] = cascade_models(config)
+    if max_memory is None:
+        max_memory = config.get("max_memory")
+    budget = parse_memory(max_memory)
+    if budget is None:
+        return plan
+
+    size = get_image_size(input_path) if os.path.isfile(input_path) else None
+    if size is None:
+        return plan
+    raw = Path(input_path).suffix.lower() in RAW_EXTENSIONS
+
+    def estimate(**overrides):
+        return estimate_peak(*size, mode, raw=raw, **{**plan, **overrides})
+
+    def decide(key, value, reason):
+        plan[key] = value
+        print(f"Memory: {reason} (estimated peak {format_bytes(estimate())})")
+
+    print(
+        f"Memory budget: {format_bytes(budget)}, "
+        f"estimated peak: {format_bytes(estimate())}"
+    )
+    if estimate() <= budget:
+        return plan
+
+    # Same masks, less memory
+    if mode in ("box", "points") and not tiled:
+        decide("tiled", True, "using tiled mask output")
+    if mode == "auto" and not stream:
+        decide("stream", True, "streaming auto masks")
+
+    if mode == "auto":
+        while estimate() > budget and plan["points_per_batch"] > MIN_POINTS_PER_BATCH:
+            ppb = plan["points_per_batch"] // 2
+            decide("points_per_batch", ppb, f"points_per_batch -> {ppb}")
+
+    # Keep the requested model(s) at the largest decode scale that fits; only
+    # move to smaller models when no scale is enough
+    requested = dict(plan)
+    for candidate in _fallbacks(model_id, config):
+        plan.update(candidate)
+        fits = [s for s in [1.0] + SCALES if estimate(scale=s) <= budget]
+        scale = fits[0] if fits else None
+        if scale is not None:
+            break
+    else:
+        # Lowering the resolution cannot help when the model alone is too big
+        fixed = BASE_BYTES + _model_bytes(plan["model_id"], plan["cascade_models"])
+        scale = SCALES[-1] if fixed < budget else 1.0
+
+    if plan["model_id"] != requested["model_id"]:
+        candidate = plan["model_id"]
+        decide("model_id", candidate, f"switching to {MODEL_NAMES[candidate]} model")
+    if plan["cascade_models"] != requested["cascade_models"]:
+        names = ", ".join(MODEL_NAMES[m] for m in plan["cascade_models"])
+        decide("cascade_models", plan["cascade_models"], f"cascade limited to {names}")
+    if scale < 1.0:
+        h, w = (round(d * scale) for d in size)
+        decide("scale", scale, f"decoding at {w}x{h} ({scale:g}x)")
+
+    if estimate() > budget:
+        print("Memory: warning, smallest settings still exceed the budget")
+    return plan
+
+
+def output_size(input_path, image, scale):
+    """Original (h, w) to save masks at, and (x, y) factors for prompts."""
+    h, w = image.shape[:2]
+    size = get_image_size(input_path) if scale < 1.0 else None
+    if size is None:
+        return (h, w), (1.0, 1.0)
+    out_h, out_w = size
+    return (out_h, out_w), (w / out_w, h / out_h)
+
+
+def scale_coords(coords, scale_xy):
+    """Scale a box or (x, y[, label]) points into the working image."""
+    sx, sy = scale_xy
+    if coords is None:
+        return None
+    if len(coords) == 4 and not hasattr(coords[0], "__len__"):
+        x1, y1, x2, y2 = coords
+        return [x1 * sx, y1 * sy, x2 * sx, y2 * sy]
+    return [(p[0] * sx, p[1] * sy, *p[2:]) for p in coords]
@@ -1,34 +1,28 @@
 import os
 import numpy as np
 import cv2
-import torch
-from PIL import Image
-from datetime import datetime, timezone
-from sam2.build_sam import build_sam2
-from sam2.sam2_image_predictor import SAM2ImagePredictor
 
-from .shared_utils import (
-    load_or_create_config,
-    get_unique_path,
-    save_pfm,
-    load_image_rgb,
-)
+from .shared_utils import load_image_rgb
+from .cascade import CascadeSegmenter, make_segmenter
+from .mask_utils import iter_mask_tiles
+from .memory_governor import plan_job, output_size, scale_coords
 
 
 # ============================================================
 # Point Selector (interactive point mode)
 # ============================================================
 class PointSelector:
-    def __init__(self, img_bgr, predictor):
+    def __init__(self, img_bgr, segmenter, tiled=False):
         self.clone = img_bgr.copy()
         self.image_bgr = img_bgr.copy()
 
         self.points_pos = []  # left-click = foreground
         self.points_neg = []  # right-click = background
 
-        self.predictor = predictor
+        self.segmenter = segmenter
+        # Tiled: current_mask holds the 256x256 logits, never a full-res mask
+        self.tiled = tiled
         self.current_mask = None
-        self.rgb_for_predictor = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
 
     def reset(self):
         self.image_bgr = self.clone.copy()
@@ -58,29 +52,30 @@ class PointSelector:
             self.render_preview()
             return
 
+        masks, scores = self.predict(low_res=self.tiled)
+        self.current_mask = masks[0]  # best mask
+        self.render_preview()
+
+    def predict(self, low_res=False):
         # Prepare points for SAM2
         all_pts = self.points_pos + self.points_neg
         labels = [1] * len(self.points_pos) + [0] * len(self.points_neg)
 
-        pts_arr = np.array(all_pts)
-        labels_arr = np.array(labels)
-
-        with torch.inference_mode():
-            masks, scores, logits = self.predictor.predict(
-                point_coords=pts_arr,
-                point_labels=labels_arr,
-                multimask_output=False,
-            )
-
-        self.current_mask = masks[0]  # best mask
-        self.render_preview()
+        return self.segmenter.predict_points(all_pts, labels, low_res=low_res)
 
     # ------------------------------------------------------------------
     def render_preview(self):
         img = self.clone.copy()
 
         # Overlay mask
-        if self.current_mask is not None:
+        if self.current_mask is not None and self.tiled:
+            # Upsample the logits tile by tile straight into the preview
+            tiles = iter_mask_tiles(
+                self.current_mask, img.shape[:2], self.segmenter.mask_threshold
+            )
+            for y0, tile in tiles:
+                img[y0 : y0 + len(tile)][tile] = (0, 0, 255)
+        elif self.current_mask is not None:
             mask = (self.current_mask.squeeze() > 0).astype(np.uint8)
             # Red overlay for mask preview
             img[mask > 0] = (0, 0, 255)
@@ -95,6 +90,34 @@ class PointSelector:
         self.image_bgr = img
 
 
+def _select_points(selector):
+    # Returns the confirmed mask (None if no points), or False on cancel
+    win = "Left Click=Positive, Right/Middle Click=Negative, Enter=Confirm, R=Reset, Esc=Cancel"
+
+    cv2.namedWindow(win, cv2.WINDOW_NORMAL)
+    cv2.setMouseCallback(win, selector.mouse_cb)
+
+    final_mask = None
+
+    while True:
+        cv2.imshow(win, selector.image_bgr)
+        key = cv2.waitKey(20) & 0xFF
+
+        if key == 13:  # ENTER
+            final_mask = selector.current_mask
+            break
+
+        elif key in (ord("r"), ord("R")):
+            selector.reset()
+
+        elif key == 27:  # ESC
+            cv2.destroyAllWindows()
+            return False
+
+    cv2.destroyAllWindows()
+    return final_mask
+
+
 # ============================================================
 # RUN POINT SEGMENTATION
 # ============================================================
@@ -104,6 +127,10 @@ def run_point_segmentation(
     num_masks=1,
     model_id=1,
     pfm=False,
+    tiled=False,
+    points=None,
+    max_memory=None,
+    cascade_threshold=None,
 ):
     # Prepare output directories
     if not os.path.exists(input_path):
@@ -119,73 +146,49 @@ def run_point_segmentation(
     save_dir = output_path
     base = os.path.splitext(os.path.basename(input_path))[0]
 
-    # Load config
-    config = load_or_create_config()
-    checkpoint = config["checkpoints"][str(model_id)]
-
-    # Select model config
-    if model_id == 1:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_l.yaml"
-    elif model_id == 2:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_b+.yaml"
-    elif model_id == 3:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_s.yaml"
-    else:
-        model_cfg = "configs/sam2.1/sam2.1_hiera_t.yaml"
-
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print("Using device:", device)
+    # Fit model, decode size and output path to the memory budget
+    plan = plan_job(input_path, "points", model_id, max_memory, tiled=tiled)
+    model_id, tiled = plan["model_id"], plan["tiled"]
 
     # Load predictor
-    sam2_model = build_sam2(model_cfg, checkpoint, device=device)
-    predictor = SAM2ImagePredictor(sam2_model)
+    # model_id "auto" = cascade from the smallest model
+    segmenter = make_segmenter(model_id, cascade_threshold, plan["cascade_models"])
+    print("Using device:", segmenter.device)
 
     # Load image
-    rgb, bgr_img = load_image_rgb(input_path)
+    rgb, bgr_img = load_image_rgb(input_path, plan["scale"])
     if bgr_img is None:
         return
-
-    with torch.inference_mode():
-        predictor.set_image(rgb)
-
-    # Create selector interface
-    win = "Left Click=Positive, Right/Middle Click=Negative, Enter=Confirm, R=Reset, Esc=Cancel"
-    selector = PointSelector(bgr_img, predictor)
-
-    cv2.namedWindow(win, cv2.WINDOW_NORMAL)
-    cv2.setMouseCallback(win, selector.mouse_cb)
-
-    final_mask = None
-
-    while True:
-        cv2.imshow(win, selector.image_bgr)
-        key = cv2.waitKey(20) & 0xFF
-
-        if key == 13:  # ENTER
-            final_mask = selector.current_mask
-            break
-
-        elif key in (ord("r"), ord("R")):
-            selector.reset()
-
-        elif key == 27:  # ESC
-            cv2.destroyAllWindows()
+    output_hw, coords_scale = output_size(input_path, rgb, plan["scale"])
+    segmenter.set_image(rgb, name=base, output_hw=output_hw)
+
+    selector = PointSelector(bgr_img, segmenter, tiled=tiled)
+
+    if points:
+        # Points given as (x, y, label): label 1 = foreground, 0 = background
+        for x, y, label in scale_coords(points, coords_scale):
+            if label:
+                selector.points_pos.append((int(x), int(y)))
+            else:
+                selector.points_neg.append((int(x), int(y)))
+        # No preview without a window
+        final_mask = selector.predict(low_res=tiled)[0][0]
+    else:
+        final_mask = _select_points(selector)
+        if final_mask is False:
             return
 
-    cv2.destroyAllWindows()
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
     if final_mask is None:
         print("No mask generated.")
         return
 
-    # Save final mask
-    mask = final_mask.squeeze().astype(np.uint8) * 255
-
-    if pfm:
-        out = get_unique_path(f"{save_dir}/{base}_{ts}_mask.pfm")
-        save_pfm(out, final_mask.squeeze())  # PFM uses float mask, not 0–255
-    else:
-        out = get_unique_path(f"{save_dir}/{base}_{ts}_mask.png")
-        Image.fromarray(mask).save(out)
-
-    print("Saved:", out)
+    # Save final mask (tiled: logits are upsampled tile by tile into the file)
+    paths = segmenter.save_masks(
+        [final_mask],
+        segmenter.output_stem(save_dir),
+        pfm,
+        indexed=False,
+        logits=tiled,
+    )
+    if isinstance(segmenter, CascadeSegmenter):
+        segmenter.record("points", paths)
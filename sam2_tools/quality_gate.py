@@ -0,0 +1,347 @@
+"""Accuracy-vs-speed regression gate for sam2-tools fast paths.
+
+Runs every case of a manifest through a reference and a candidate
+configuration of the ``run_*`` functions and compares the saved masks.
+
+Manifest (YAML, image paths relative to the manifest):
+
+    reference: {model_id: 1}
+    candidate: {model_id: 4, tiled: true}
+    thresholds: {min_iou: 0.9, min_fscore: 0.85}
+    cases:
+      - {image: images/cat.jpg, mode: box, box: [120, 80, 940, 700]}
+      - {image: images/dog.jpg, mode: points, points: [[400, 300, 1], [50, 60, 0]]}
+      - {image: images/street.jpg, mode: auto, num_masks: 5}
+
+Usage:
+
+    python -m sam2_tools.quality_gate manifest.yaml --candidate model_id=3
+"""
+
+import argparse
+import contextlib
+import inspect
+import os
+import re
+import sys
+import tempfile
+import time
+from glob import glob
+
+import cv2
+import numpy as np
+import yaml
+from PIL import Image
+
+from .auto_segmentation import run_auto_segmentation
+from .box_segmentation import run_box_segmentation
+from .point_segmentation import run_point_segmentation
+from .mask_utils import pack_mask, packed_iou, popcount_rows
+from .segmenter import Segmenter
+
+RUNNERS = {
+    "box": run_box_segmentation,
+    "points": run_point_segmentation,
+    "auto": run_auto_segmentation,
+}
+
+DEFAULT_THRESHOLDS = {"min_iou": 0.9, "min_fscore": 0.85}
+
+# Boundary match tolerance as a fraction of the image diagonal (DAVIS default)
+BOUNDARY_TOLERANCE = 0.008
+
+
+# ============================================================
+# Metrics
+# ============================================================
+def _boundary(mask):
+    m = mask.astype(np.uint8)
+    return (m - cv2.erode(m, np.ones((3, 3), np.uint8))) > 0
+
+
+def boundary_fscore(ref, cand, tolerance=BOUNDARY_TOLERANCE):
+    """F-measure of boundary pixels matched within ``tolerance`` * diagonal."""
+    ref_b = _boundary(ref)
+    cand_b = _boundary(cand)
+    if not ref_b.any() and not cand_b.any():
+        return 1.0
+    if not ref_b.any() or not cand_b.any():
+        return 0.0
+
+    radius = max(1, int(round(tolerance * np.hypot(*ref.shape))))
+    kernel = cv2.getStructuringElement(
+        cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1)
+    )
+    ref_zone = cv2.dilate(ref_b.astype(np.uint8), kernel) > 0
+    cand_zone = cv2.dilate(cand_b.astype(np.uint8), kernel) > 0
+
+    precision = np.count_nonzero(cand_b & ref_zone) / np.count_nonzero(cand_b)
+    recall = np.count_nonzero(ref_b & cand_zone) / np.count_nonzero(ref_b)
+    if precision + recall == 0:
+        return 0.0
+    return 2 * precision * recall / (precision + recall)
+
+
+def compare_masks(ref_masks, cand_masks):
+    """Match every reference mask to its best candidate; return mean IoU and F."""
+    if not ref_masks:
+        raise ValueError("No reference masks to compare against.")
+    if not cand_masks:
+        return 0.0, 0.0
+
+    h, w = ref_masks[0].shape
+    cand_masks = [
+        m
+        if m.shape == (h, w)
+        else cv2.resize(m.astype(np.uint8), (w, h), interpolation=cv2.INTER_NEAREST) > 0
+        for m in cand_masks
+    ]
+    cand_packed = np.stack([pack_mask(m) for m in cand_masks])
+    cand_areas = popcount_rows(cand_packed)
+
+    ious, fscores = [], []
+    for ref in ref_masks:
+        ref_packed = pack_mask(ref)
+        iou = packed_iou(ref_packed, popcount_rows(ref_packed)[0], cand_packed, cand_areas)
+        best = int(np.argmax(iou))
+        ious.append(float(iou[best]))
+        fscores.append(boundary_fscore(ref, cand_masks[best]))
+    return float(np.mean(ious)), float(np.mean(fscores))
+
+
+# ============================================================
+# Running cases
+# ============================================================
+def _mask_index(path):
+    match = re.search(r"_mask(?:_(\d+))?(?:_\d+)?\.png$", path)
+    return int(match.group(1) or 0) if match else 0
+
+
+def _load_masks(folder):
+    paths = sorted(glob(os.path.join(folder, "*_mask*.png")), key=_mask_index)
+    return [np.array(Image.open(p).convert("L")) > 127 for p in paths]
+
+
+@contextlib.contextmanager
+def _timed_model_loads():
+    # Collect the time spent building models (every runner and the cascade
+    # load through Segmenter) so it can be reported apart from inference
+    loads = []
+    init = Segmenter.__init__
+
+    def timed_init(self, *args, **kwargs):
+        start = time.perf_counter()
+        init(self, *args, **kwargs)
+        loads.append(time.perf_counter() - start)
+
+    Segmenter.__init__ = timed_init
+    try:
+        yield loads
+    finally:
+        Segmenter.__init__ = init
+
+
+def _run_case(case, config):
+    """Run one case; return ``(masks, run seconds, model load seconds)``.
+
+    Run seconds exclude model loading but include image decode and saving.
+    """
+    runner = RUNNERS[case["mode"]]
+    kwargs = {
+        "input_path": case["image_path"],
+        "num_masks": case.get("num_masks", 1),
+        "model_id": 1,
+        "pfm": False,
+        "box": case.get("box"),
+        "overlay": False,
+        "points": case.get("points"),
+    }
+    kwargs.update(config)
+    # Masks are read back as PNG, and nothing here may open a window
+    kwargs["pfm"] = False
+    kwargs["overlay"] = False
+
+    # Only pass what this runner accepts (e.g. "tiled" is not an auto option)
+    accepted = inspect.signature(runner).parameters
+    with tempfile.TemporaryDirectory() as out_dir:
+        kwargs["output_path"] = out_dir
+        with _timed_model_loads() as loads:
+            start = time.perf_counter()
+            runner(**{k: v for k, v in kwargs.items() if k in accepted})
+            elapsed = time.perf_counter() - start
+        load = sum(loads)
+        return _load_masks(out_dir), elapsed - load, load
+
+
+def load_manifest(path, reference=None, candidate=None, thresholds=None):
+    """Read a manifest and apply CLI overrides to its configs and thresholds."""
+    with open(path, "r") as f:
+        manifest = yaml.safe_load(f)
+
+    root = os.path.dirname(os.path.abspath(path))
+    for i, case in enumerate(manifest["cases"]):
+        mode = case.get("mode")
+        if mode not in RUNNERS:
+            raise ValueError(f"Case {i}: mode must be one of {sorted(RUNNERS)}, got {mode!r}")
+        # Without stored prompts box/point mode would open the selection window
+        if mode == "box" and not case.get("box"):
+            raise ValueError(f"Case {i} ({case['image']}): box mode needs 'box'")
+        if mode == "points" and not case.get("points"):
+            raise ValueError(f"Case {i} ({case['image']}): points mode needs 'points'")
+        case["image_path"] = os.path.join(root, case["image"])
+
+    manifest["reference"] = {**manifest.get("reference", {}), **(reference or {})}
+    manifest["candidate"] = {**manifest.get("candidate", {}), **(candidate or {})}
+    manifest["thresholds"] = {
+        **DEFAULT_THRESHOLDS,
+        **manifest.get("thresholds", {}),
+        **(thresholds or {}),
+    }
+    return manifest
+
+
+def _time_configs(case, manifest, repeat):
+    # Fastest (run, load) seconds of ``repeat`` timed runs per config. The
+    # order alternates so neither config always pays for what the previous
+    # run left behind.
+    times = {"reference": [], "candidate": []}
+    for i in range(repeat):
+        order = ["reference", "candidate"]
+        for name in order if i % 2 == 0 else reversed(order):
+            times[name].append(_run_case(case, manifest[name])[1:])
+    return [
+        tuple(min(t[k] for t in times[name]) for k in (0, 1))
+        for name in ("reference", "candidate")
+    ]
+
+
+def run_gate(manifest, repeat=1):
+    """Run every case with the reference and candidate configs; one result per case.
+
+    The masks come from an untimed warm-up run per config, which absorbs
+    CUDA/cuDNN init and cold caches for the image and checkpoint. Then
+    ``repeat`` timed runs follow. Model load time is reported on its own
+    and left out of ``speedup``.
+    """
+    limits = manifest["thresholds"]
+
+    rows = []
+    for case in manifest["cases"]:
+        ref_masks = _run_case(case, manifest["reference"])[0]
+        cand_masks = _run_case(case, manifest["candidate"])[0]
+
+        row = {
+            "image": case["image"],
+            "mode": case["mode"],
+            "iou": None,
+            "fscore": None,
+            "ref_time": None,
+            "cand_time": None,
+            "ref_load": None,
+            "cand_load": None,
+            "speedup": None,
+            "passed": False,
+            "error": None,
+        }
+        if not ref_masks:
+            # Bad image path, missing checkpoint, ... : nothing to compare or time
+            row["error"] = "reference wrote no masks"
+            rows.append(row)
+            continue
+
+        row["iou"], row["fscore"] = compare_masks(ref_masks, cand_masks)
+        row["passed"] = row["iou"] >= limits["min_iou"] and row["fscore"] >= limits["min_fscore"]
+
+        (ref_time, ref_load), (cand_time, cand_load) = _time_configs(case, manifest, repeat)
+        row["ref_time"], row["cand_time"] = ref_time, cand_time
+        row["ref_load"], row["cand_load"] = ref_load, cand_load
+        row["speedup"] = ref_time / cand_time if cand_time > 0 else float("inf")
+        rows.append(row)
+    return rows
+
+
+def print_report(rows, manifest):
+    print()
+    print("Reference:", manifest["reference"])
+    print("Candidate:", manifest["candidate"])
+    print("Thresholds:", manifest["thresholds"])
+    print(
+        f"{'image':<30} {'mode':<7} {'IoU':>6} {'BF':>6} {'ref load':>8} "
+        f"{'cand load':>9} {'ref s':>8} {'cand s':>8} {'speedup':>8}  result"
+    )
+    for r in rows:
+        if r["error"]:
+            # No metrics or times worth showing
+            metrics = f"{'-':>6} {'-':>6} {'-':>8} {'-':>9} {'-':>8} {'-':>8} {'-':>8}"
+        else:
+            metrics = (
+                f"{r['iou']:>6.3f} {r['fscore']:>6.3f} "
+                f"{r['ref_load']:>8.2f} {r['cand_load']:>9.2f} "
+                f"{r['ref_time']:>8.2f} {r['cand_time']:>8.2f} {r['speedup']:>7.2f}x"
+            )
+        print(
+            f"{r['image'][-30:]:<30} {r['mode']:<7} {metrics}  "
+            f"{'ok' if r['passed'] else 'FAIL'}"
+            + (f" ({r['error']})" if r["error"] else "")
+        )
+
+    # Cases that errored count as failures but stay out of the summary
+    valid = [r for r in rows if not r["error"]]
+    if valid:
+        total = sum(r["ref_time"] for r in valid) / max(
+            sum(r["cand_time"] for r in valid), 1e-9
+        )
+        print(
+            f"{'mean':<30} {'':<7} {np.mean([r['iou'] for r in valid]):>6.3f} "
+            f"{np.mean([r['fscore'] for r in valid]):>6.3f} {'':>8} {'':>9} "
+            f"{'':>8} {'':>8} {total:>7.2f}x"
+        )
+
+
+# ============================================================
+# CLI
+# ============================================================
+def _parse_overrides(items):
+    # KEY=VALUE pairs, values parsed as YAML (so 4 -> int, true -> bool)
+    overrides = {}
+    for item in items or []:
+        key, _, value = item.partition("=")
+        overrides[key.strip()] = yaml.safe_load(value)
+    return overrides
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SAM2 accuracy-vs-speed regression gate")
+    parser.add_argument("manifest", help="YAML manifest with images, prompts and configs")
+    parser.add_argument("--reference", action="append", metavar="KEY=VALUE", help="Override a reference option, repeatable")
+    parser.add_argument("--candidate", action="append", metavar="KEY=VALUE", help="Override a candidate option, repeatable")
+    parser.add_argument("--min-iou", type=float, help="Fail when a case's mean mask IoU is below this")
+    parser.add_argument("--min-fscore", type=float, help="Fail when a case's mean boundary F-score is below this")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per configuration after one untimed warm-up run, fastest time is kept (Default: 1)")
+    args = parser.parse_args(argv)
+
+    thresholds = {}
+    if args.min_iou is not None:
+        thresholds["min_iou"] = args.min_iou
+    if args.min_fscore is not None:
+        thresholds["min_fscore"] = args.min_fscore
+
+    try:
+        manifest = load_manifest(
+            args.manifest,
+            _parse_overrides(args.reference),
+            _parse_overrides(args.candidate),
+            thresholds,
+        )
+    except ValueError as exc:
+        parser.error(str(exc))
+    rows = run_gate(manifest, args.repeat)
+    print_report(rows, manifest)
+
+    passed = all(r["passed"] for r in rows)
+    print("PASSED" if passed else "FAILED")
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import os
+import numpy as np
+import cv2
+import torch
+from PIL import Image
+from datetime import datetime, timezone
+from sam2.build_sam import build_sam2
+from sam2.sam2_image_predictor import SAM2ImagePredictor
+from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
+
+from .shared_utils import (
+    load_or_create_config,
+    get_unique_path,
+    save_pfm,
+    load_image_rgb,
+)
+from .mask_utils import (
+    predict_low_res,
+    record_mask,
+    iter_mask_tiles,
+    save_logits_mask,
+)
+
+# Model ID -> SAM2 model config
+MODEL_CONFIGS = {
+    1: "configs/sam2.1/sam2.1_hiera_l.yaml",
+    2: "configs/sam2.1/sam2.1_hiera_b+.yaml",
+    3: "configs/sam2.1/sam2.1_hiera_s.yaml",
+    4: "configs/sam2.1/sam2.1_hiera_t.yaml",
+}
+
+
+def get_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+# ============================================================
+# Segmenter (loaded model + per-image session)
+# ============================================================
+class Segmenter:
+    """Hold a loaded SAM2 model and answer box/point/auto queries on one image.
+
+    Load once, call ``set_image`` per image, then run any number of
+    ``predict_box`` / ``predict_points`` / ``generate`` queries. Results are
+    NumPy arrays; writing them to disk is left to ``save_masks``.
+
+    Auto mode in the CLI builds the model with ``apply_postprocessing=False``.
+    """
+
+    def __init__(self, model_id=1, device=None, apply_postprocessing=True, config=None):
+        config = config or load_or_create_config()
+        self.model_id = int(model_id)
+        self.device = device or get_device()
+        self.model = build_sam2(
+            MODEL_CONFIGS[self.model_id],
+            config["checkpoints"][str(self.model_id)],
+            device=self.device,
+            apply_postprocessing=apply_postprocessing,
+        )
+        self.predictor = SAM2ImagePredictor(self.model)
+        self.image = None
+        self.name = None
+        self.output_hw = None
+        self._embedded = False
+
+    # ------------------------------------------------------------------
+    def set_image(self, image, name=None, output_hw=None):
+        """Set the image to query: a file path or an RGB uint8 array.
+
+        Prompts are in this image's coordinates. ``output_hw`` is the size
+        masks are saved at, when the image was decoded at a reduced scale.
+        The image embedding is computed on the first ``predict_*`` call
+        (``generate`` embeds its own crops).
+        """
+        if isinstance(image, (str, os.PathLike)):
+            path = os.fspath(image)
+            image, _ = load_image_rgb(path)
+            if image is None:
+                raise ValueError(f"Could not load image: {path}")
+            name = name or os.path.splitext(os.path.basename(path))[0]
+
+        self.image = image
+        self.name = name or "image"
+        self.output_hw = tuple(output_hw or image.shape[:2])
+        self._embedded = False
+
+    @property
+    def mask_threshold(self):
+        return self.predictor.mask_threshold
+
+    @property
+    def image_hw(self):
+        return self.image.shape[:2]
+
+    def _check_image(self):
+        if self.image is None:
+            raise RuntimeError("No image set. Call set_image() first.")
+
+    # ------------------------------------------------------------------
+    def _predict(self, low_res, **prompt):
+        self._check_image()
+        with torch.inference_mode():
+            if not self._embedded:
+                self.predictor.set_image(self.image)
+                self._embedded = True
+            if low_res:
+                masks, scores = predict_low_res(self.predictor, **prompt)
+            else:
+                masks, scores, _ = self.predictor.predict(**prompt)
+                # predict() returns 0/1 floats
+                masks = np.asarray(masks) > 0
+
+        order = np.argsort(-np.asarray(scores))
+        return np.asarray(masks)[order], np.asarray(scores)[order]
+
+    def predict_box(self, box, multimask_output=True, low_res=False):
+        """Masks for a box ``(x1, y1, x2, y2)``, best score first.
+
+        Returns ``(masks, scores)``: boolean (C, H, W) masks, or the
+        (C, 256, 256) logits when ``low_res`` is set (save them with
+        ``save_masks(..., logits=True)``).
+        """
+        return self._predict(
+            low_res,
+            box=np.asarray(box, dtype=np.float32),
+            multimask_output=multimask_output,
+        )
+
+    def predict_points(self, points, labels=None, multimask_output=False, low_res=False):
+        """Masks for point prompts, best score first.
+
+        ``points`` is a list of ``(x, y)`` with matching ``labels``
+        (1 = foreground, 0 = background), or a list of ``(x, y, label)``.
+        """
+        points = np.asarray(points)
+        if labels is None:
+            points, labels = points[:, :2], points[:, 2]
+        return self._predict(
+            low_res,
+            point_coords=points,
+            point_labels=np.asarray(labels),
+            multimask_output=multimask_output,
+        )
+
+    def generate(self, stream=False, **generator_args):
+        """Automatic masks as SAM2 generator records, in generator order.
+
+        With ``stream`` the ``segmentation`` of each record stays an
+        uncompressed RLE; use ``mask_utils.record_mask`` to decode one.
+        ``generator_args`` go to ``SAM2AutomaticMaskGenerator``
+        (e.g. ``points_per_batch``).
+        """
+        self._check_image()
+        generator = SAM2AutomaticMaskGenerator(
+            self.model,
+            output_mode="uncompressed_rle" if stream else "binary_mask",
+            **generator_args,
+        )
+        with torch.inference_mode():
+            return generator.generate(self.image)
+
+    # ------------------------------------------------------------------
+    def output_stem(self, output_path):
+        """``<output>/<image name>_<UTC timestamp>`` for one batch of outputs."""
+        ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
+        return f"{output_path}/{self.name}_{ts}"
+
+    def save_masks(self, masks, stem, pfm=False, indexed=True, logits=False):
+        """Write masks as ``<stem>_mask_<i>.png`` (or ``.pfm``); return the paths.
+
+        Accepts boolean masks or generator records, or low-res logits with
+        ``logits=True``. Records and logits are decoded one at a time while
+        writing.
+        """
+        ext = "pfm" if pfm else "png"
+        paths = []
+        for i, m in enumerate(masks):
+            suffix = f"_mask_{i}" if indexed else "_mask"
+            out = get_unique_path(f"{stem}{suffix}.{ext}")
+
+            if logits:
+                save_logits_mask(out, m, self.output_hw, pfm, self.mask_threshold)
+            else:
+                if isinstance(m, dict):
+                    m = record_mask(m)
+                seg = np.squeeze(m)
+                if seg.shape != self.output_hw:
+                    h, w = self.output_hw
+                    seg = cv2.resize(
+                        seg.astype(np.uint8), (w, h), interpolation=cv2.INTER_NEAREST
+                    )
+                if pfm:
+                    save_pfm(out, seg.astype(np.float32))
+                else:
+                    Image.fromarray(seg.astype(np.uint8) * 255).save(out)
+                del seg
+
+            print("Saved:", out)
+            paths.append(out)
+        return paths
+
+    def save_overlay(self, mask, stem, logits=False):
+        """Paint ``mask`` red over the image and save ``<stem>_overlay.jpg``.
+
+        The overlay is written at the size of the image given to ``set_image``.
+        """
+        overlay_img = self.image.copy()
+        if logits:
+            tiles = iter_mask_tiles(mask, self.image_hw, self.mask_threshold)
+            for y0, tile in tiles:
+                overlay_img[y0 : y0 + len(tile)][tile] = [255, 0, 0]
+        else:
+            overlay_img[np.squeeze(mask).astype(bool)] = [255, 0, 0]
+
+        out = get_unique_path(f"{stem}_overlay.jpg")
+        Image.fromarray(overlay_img).save(out, quality=95)
+        print("Saved overlay:", out)
+        return out
@@ -1,5 +1,7 @@
 import os
 import platform
+import struct
+import zlib
 from pathlib import Path
 import numpy as np
 import yaml
@@ -77,10 +79,83 @@ def save_pfm(path, image, scale=1.0):
         image.tofile(f)
 
 
+# ============================================================
+# Tiled mask writers (rows are written as they are produced)
+# ============================================================
+def _png_chunk(f, tag, data):
+    f.write(struct.pack(">I", len(data)))
+    f.write(tag)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(tag)) & 0xFFFFFFFF))
+
+
+def save_png_tiles(path, width, height, tiles):
+    """Write an 8-bit grayscale PNG from uint8 row tiles, top to bottom."""
+    compressor = zlib.compressobj()
+    rows_written = 0
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        _png_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+
+        for tile in tiles:
+            # Prefix every row with filter type 0 (None)
+            rows = np.zeros((tile.shape[0], width + 1), dtype=np.uint8)
+            rows[:, 1:] = tile
+            rows_written += tile.shape[0]
+            data = compressor.compress(rows.tobytes())
+            if data:
+                _png_chunk(f, b"IDAT", data)
+
+        _png_chunk(f, b"IDAT", compressor.flush())
+        _png_chunk(f, b"IEND", b"")
+
+    if rows_written != height:
+        raise ValueError(f"PNG expected {height} rows, got {rows_written}")
+
+
+def save_pfm_tiles(path, width, height, tiles, scale=1.0):
+    """Write a grayscale PFM from float32 row tiles, bottom to top."""
+    rows_written = 0
+
+    with open(path, "wb") as f:
+        f.write(b"Pf\n")
+        f.write(f"{width} {height}\n".encode())
+
+        endian = -scale if np.dtype(np.float32).byteorder in ("=", "little") else scale
+        f.write(f"{endian}\n".encode())
+
+        for tile in tiles:
+            # PFM stores the bottom row first
+            np.flipud(tile).astype(np.float32).tofile(f)
+            rows_written += tile.shape[0]
+
+    if rows_written != height:
+        raise ValueError(f"PFM expected {height} rows, got {rows_written}")
+
+
 # ============================================================
 # Image loading
 # ============================================================
-def load_image_rgb(path):
+def get_image_size(path):
+    """(height, width) of the decoded image, read without decoding pixels."""
+    ext = Path(path).suffix.lower()
+    try:
+        if ext in RAW_EXTENSIONS:
+            with rawpy.imread(path) as raw:
+                sizes = raw.sizes
+                # Flip 5/6 = rotated by 90 degrees in the postprocessed output
+                if sizes.flip in (5, 6):
+                    return sizes.width, sizes.height
+                return sizes.height, sizes.width
+        with Image.open(path) as img:
+            return img.height, img.width
+    except Exception as exc:
+        print("Failed to read image size:", exc)
+        return None
+
+
+def load_image_rgb(path, scale=1.0):
     if not os.path.isfile(path):
         print("Input not found:", path)
         return None, None
@@ -89,13 +164,25 @@ def load_image_rgb(path):
     try:
         if ext in RAW_EXTENSIONS:
             with rawpy.imread(path) as raw:
-                rgb = raw.postprocess()
+                # Half-size demosaic avoids a full-resolution buffer
+                rgb = raw.postprocess(half_size=scale <= 0.5)
         else:
-            rgb = np.array(Image.open(path).convert("RGB"))
+            with Image.open(path) as img:
+                if scale < 1.0:
+                    # JPEG can decode straight at a reduced size
+                    img.draft("RGB", (int(img.width * scale), int(img.height * scale)))
+                rgb = np.array(img.convert("RGB"))
     except Exception as exc:
         print("Failed to load image:", exc)
         return None, None
 
+    if scale < 1.0:
+        size = get_image_size(path)
+        if size is not None:
+            h, w = (max(1, round(d * scale)) for d in size)
+            if rgb.shape[:2] != (h, w):
+                rgb = cv2.resize(rgb, (w, h), interpolation=cv2.INTER_AREA)
+
     bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
     return rgb, bgr
 
@@ -132,7 +219,9 @@ def load_or_create_config():
                 "2": str(base / "sam2.1_hiera_base_plus.pt"),
                 "3": str(base / "sam2.1_hiera_small.pt"),
                 "4": str(base / "sam2.1_hiera_tiny.pt"),
-            }
+            },
+            # Peak memory budget, e.g. "8G" (null = no limit)
+            "max_memory": None,
         }
 
         base.mkdir(parents=True, exist_ok=True)